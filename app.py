@@ -13,12 +13,330 @@ import edge_tts
 import subprocess
 import tempfile
 import time
+import hashlib
+import sys
+import queue
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from pydub import AudioSegment
+from project import Project, atomic_write, atomic_write_json, content_hash
 
 CONFIG_FILE = "config.json"
 TEMP_DIR = "temp_files"
 OUTPUT_DIR = "output"
 
+# Per-request TTS timeout: a fixed allowance plus time proportional to the text
+TTS_BASE_TIMEOUT = 15
+TTS_SECONDS_PER_CHAR = 0.05
+EDGE_TTS_CONCURRENCY = 4
+POLLINATIONS_TTS_CONCURRENCY = 4
+LOCAL_TTS_WORKERS = 2
+TTS_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_workers.py")
+
+RENDER_SIZE = (1920, 1080)
+RENDER_FPS = 30
+
+# Export formats. 'fit' is how the 16:9 master frame maps onto the target:
+# 'pad' letterboxes, 'crop' fills the frame and trims the centre. A bitrate of
+# None on a master-sized target means the rendered segments are copied as-is.
+OUTPUT_TARGETS = {
+    '1080p': {'label': "16:9 1080p", 'size': (1920, 1080), 'fit': 'pad', 'bitrate': None},
+    'vertical': {'label': "9:16 Vertical", 'size': (1080, 1920), 'fit': 'crop', 'bitrate': '6M'},
+    'preview': {'label': "480p Preview", 'size': (854, 480), 'fit': 'pad', 'bitrate': '1M'},
+}
+
+
+# Scene schema: field -> allowed values (None means any non-empty string)
+SCENE_FIELDS = {
+    'narration': None,
+    'media_source': ('pexels', 'ai'),
+    'query': None,
+    'media_type': ('photo', 'video'),
+}
+
+# Artifacts derived from a scene and what each one is built from. Entries are
+# either scene fields or other artifacts.
+ARTIFACT_DEPENDENCIES = {
+    'search': ('media_source', 'query', 'media_type'),
+    'media': ('search',),
+    'asset': ('media',),
+    'tts': ('narration',),
+    'subtitles': ('narration', 'tts'),
+    'segment': ('asset',),
+}
+
+# Project section holding each artifact. Search results and normalized assets
+# are not stored on their own: they live inside the media file and encoded
+# segment entries. Subtitle cues are cheap and rebuilt on every export.
+ARTIFACT_SECTIONS = {
+    'search': 'media',
+    'media': 'media',
+    'asset': 'segments',
+    'tts': 'narration',
+    'subtitles': None,
+    'segment': 'segments',
+}
+
+
+# Artifact whose input hash identifies each project section's entries
+SECTION_ARTIFACTS = {
+    'media': 'media',
+    'narration': 'tts',
+    'segments': 'segment',
+}
+
+
+def artifact_sections(artifacts):
+    return {ARTIFACT_SECTIONS[artifact] for artifact in artifacts} - {None}
+
+
+def validate_scenes(data):
+    if not isinstance(data, list):
+        return ["Top level must be an array of scenes"]
+
+    errors = []
+    for i, scene in enumerate(data):
+        if not isinstance(scene, dict):
+            errors.append(f"Scene {i + 1}: must be an object")
+            continue
+
+        for field, allowed in SCENE_FIELDS.items():
+            value = scene.get(field)
+            if field not in scene:
+                errors.append(f"Scene {i + 1}: missing '{field}'")
+            elif not isinstance(value, str) or not value.strip():
+                errors.append(f"Scene {i + 1}: '{field}' must be a non-empty string")
+            elif allowed and value not in allowed:
+                errors.append(f"Scene {i + 1}: '{field}' must be one of {', '.join(allowed)}")
+    return errors
+
+
+def artifact_fields(artifact):
+    # Scene fields an artifact depends on, directly or through other artifacts
+    fields = []
+    for dependency in ARTIFACT_DEPENDENCIES[artifact]:
+        if dependency in ARTIFACT_DEPENDENCIES:
+            fields.extend(f for f in artifact_fields(dependency) if f not in fields)
+        elif dependency not in fields:
+            fields.append(dependency)
+    return fields
+
+
+def affected_artifacts(changed):
+    # Everything downstream of the changed fields or artifacts
+    affected = set()
+    pending = list(changed)
+    while pending:
+        name = pending.pop()
+        for artifact, dependencies in ARTIFACT_DEPENDENCIES.items():
+            if name in dependencies and artifact not in affected:
+                affected.add(artifact)
+                pending.append(artifact)
+    return affected
+
+
+def scene_inputs_hash(scene, artifact, *extra):
+    return content_hash(*extra, *[scene[field] for field in artifact_fields(artifact)])
+
+
+# TTS engines. submit() returns a concurrent.futures.Future that resolves once
+# the audio file is in place. Throughput is recorded per batch of requests by
+# the caller, in wall-clock time, so concurrent requests are not double-counted.
+class TTSEngine(ABC):
+    label = "TTS"
+    extension = '.mp3'
+    # Whether the voice setting changes the audio; part of the cache key if so
+    uses_voice = True
+
+    def __init__(self):
+        self.stats_lock = threading.Lock()
+        self.characters = 0
+        self.seconds = 0.0
+        self.requests = 0
+
+    def timeout_for(self, text):
+        return TTS_BASE_TIMEOUT + len(text) * TTS_SECONDS_PER_CHAR
+
+    def submit(self, text, voice, output_file):
+        return self._submit(text, voice, output_file, self.timeout_for(text))
+
+    @abstractmethod
+    def _submit(self, text, voice, output_file, timeout):
+        pass
+
+    def record(self, characters, requests, seconds):
+        with self.stats_lock:
+            self.characters += characters
+            self.requests += requests
+            self.seconds += seconds
+
+    @property
+    def throughput(self):
+        with self.stats_lock:
+            return self.characters / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        pass
+
+
+class EdgeTTSEngine(TTSEngine):
+    label = "Edge TTS"
+
+    def __init__(self):
+        super().__init__()
+
+        # One event loop shared by every request, running on its own thread
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(EDGE_TTS_CONCURRENCY)
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def _submit(self, text, voice, output_file, timeout):
+        return asyncio.run_coroutine_threadsafe(
+            self._synthesize(text, voice, output_file, timeout), self.loop)
+
+    async def _synthesize(self, text, voice, output_file, timeout):
+        async with self.semaphore:
+            return await asyncio.wait_for(self._stream(text, voice, output_file), timeout)
+
+    async def _stream(self, text, voice, output_file):
+        partial_file = output_file + '.part'
+
+        # Write audio chunks as they arrive instead of buffering the whole clip
+        communicate = edge_tts.Communicate(text, voice)
+        with open(partial_file, 'wb') as f:
+            async for chunk in communicate.stream():
+                if chunk['type'] == 'audio':
+                    f.write(chunk['data'])
+
+        os.replace(partial_file, output_file)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class PollinationsTTSEngine(TTSEngine):
+    label = "Pollinations.ai Audio"
+    uses_voice = False
+    url = "https://text-to-speech.pollinations.ai/audio"
+
+    def __init__(self):
+        super().__init__()
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=POLLINATIONS_TTS_CONCURRENCY)
+
+    def _submit(self, text, voice, output_file, timeout):
+        return self.executor.submit(self._synthesize, text, output_file, timeout)
+
+    def _synthesize(self, text, output_file, timeout):
+        started = time.perf_counter()
+        partial_file = output_file + '.part'
+
+        params = {
+            "text": text,
+            "voice": "en-US-AriaNeural"
+        }
+
+        with self.session.get(self.url, params=params, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise Exception(f"Audio generation failed: {response.status_code}")
+
+            with open(partial_file, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                    if time.perf_counter() - started > timeout:
+                        raise Exception(f"Audio generation timed out after {timeout:.0f}s")
+
+        os.replace(partial_file, output_file)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+# Local engines run as a pool of long-lived worker processes (tts_workers.py).
+# Each worker loads its backend once and then serves requests over its pipes.
+class LocalTTSEngine(TTSEngine):
+    backend_name = None
+    extension = '.wav'
+    uses_voice = False
+
+    def __init__(self, workers=LOCAL_TTS_WORKERS):
+        super().__init__()
+        self.idle = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Start every worker now and wait for it to load, so a missing
+        # backend is reported here rather than on the first request
+        try:
+            for _ in range(workers):
+                self.idle.put(self._start_worker())
+        except Exception:
+            self.close()
+            raise
+
+    def _start_worker(self):
+        process = subprocess.Popen([sys.executable, TTS_WORKER_SCRIPT, self.backend_name],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        reply = self._read_reply(process)
+        if 'error' in reply:
+            process.kill()
+            raise Exception(reply['error'])
+        return process
+
+    def _read_reply(self, process):
+        line = process.stdout.readline()
+        if not line:
+            raise Exception(f"{self.label} worker exited unexpectedly")
+        return json.loads(line)
+
+    def _submit(self, text, voice, output_file, timeout):
+        return self.executor.submit(self._synthesize, text, voice, output_file, timeout)
+
+    def _synthesize(self, text, voice, output_file, timeout):
+        process = self.idle.get()
+
+        # The worker enforces the timeout itself; this only catches a hung worker
+        watchdog = threading.Timer(timeout + 10, process.kill)
+        watchdog.start()
+        try:
+            request = {'text': text, 'voice': voice, 'output_file': output_file, 'timeout': timeout}
+            process.stdin.write(json.dumps(request) + '\n')
+            process.stdin.flush()
+            reply = self._read_reply(process)
+        except Exception:
+            # Replace a worker that died or hung mid-request
+            process.kill()
+            process = self._start_worker()
+            raise
+        finally:
+            watchdog.cancel()
+            self.idle.put(process)
+
+        if 'error' in reply:
+            raise Exception(reply['error'])
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+        # Workers exit when their input is closed
+        while not self.idle.empty():
+            self.idle.get().stdin.close()
+
+
+class KokoroTTSEngine(LocalTTSEngine):
+    # Kokoro TTS - using espeak as fallback since kokoro setup is complex
+    label = "Kokoro TTS"
+    backend_name = 'espeak'
+
+
+TTS_ENGINES = {
+    'edge': EdgeTTSEngine,
+    'kokoro': KokoroTTSEngine,
+    'pollinations': PollinationsTTSEngine,
+}
+
+
 class VideoCreatorApp:
     def __init__(self, root):
         self.root = root
@@ -33,10 +351,14 @@ class VideoCreatorApp:
         self.config = self.load_config()
 
         # Data storage
+        self.project = None
         self.scenes = []
         self.media_cache = {}
         self.audio_file = None
         self.subtitles_data = None
+        self.tts_engines = {}
+        self.workers = set()
+        self.attach_project(self.open_startup_project())
 
         # Create notebook
         self.notebook = ttk.Notebook(root)
@@ -49,6 +371,66 @@ class VideoCreatorApp:
         self.create_audio_tab()
         self.create_export_tab()
 
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        if self.audio_file:
+            self._audio_complete()
+
+    def open_startup_project(self):
+        project_dir = self.config.get('project_dir') or TEMP_DIR
+        try:
+            return Project(project_dir)
+        except Exception as e:
+            print(f"Error opening project {project_dir}: {e}")
+
+        # Start in a fresh scratch project rather than refusing to launch
+        scratch_dir = tempfile.mkdtemp(prefix="project_", dir=TEMP_DIR)
+        messagebox.showerror("Error", f"Could not open project {project_dir}.\n"
+                                      f"Starting a new project in {scratch_dir}.")
+        return Project(scratch_dir)
+
+    def start_worker(self, target, *args):
+        # Background jobs write into the current project, so keep track of
+        # them to avoid switching projects underneath one
+        def run():
+            try:
+                target(*args)
+            finally:
+                self.workers.discard(threading.current_thread())
+
+        worker = threading.Thread(target=run, daemon=True)
+        self.workers.add(worker)
+        worker.start()
+
+    def attach_project(self, project):
+        if self.project:
+            self.project.close()
+
+        self.project = project
+        self.scenes = project.scenes
+        self.media_cache = project.media
+
+        if project.has_file(project.audio):
+            self.audio_file = project.path(project.audio['filepath'])
+        else:
+            self.audio_file = None
+
+    def on_close(self):
+        try:
+            self.project.close()
+        except Exception as e:
+            print(f"Error saving project: {e}")
+
+        for engine in self.tts_engines.values():
+            engine.close()
+        self.root.destroy()
+
+    def get_tts_engine(self, name):
+        # Engines are created on first use and kept warm for the whole session
+        if name not in self.tts_engines:
+            self.tts_engines[name] = TTS_ENGINES[name]()
+        return self.tts_engines[name]
+
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
@@ -56,8 +438,7 @@ class VideoCreatorApp:
         return {"pexels_api_key": ""}
 
     def save_config(self):
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        atomic_write_json(CONFIG_FILE, self.config)
 
     def create_settings_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -128,6 +509,15 @@ class VideoCreatorApp:
         title = ttk.Label(main_frame, text="Scene Configuration", font=('Arial', 16, 'bold'))
         title.pack(pady=(0, 10))
 
+        # Project
+        project_frame = ttk.LabelFrame(main_frame, text="Project", padding=10)
+        project_frame.pack(fill='x', pady=5)
+
+        self.project_label = ttk.Label(project_frame, text=os.path.abspath(self.project.root_dir))
+        self.project_label.pack(side='left', padx=5)
+        ttk.Button(project_frame, text="💾 Save Project", command=self.save_project).pack(side='right', padx=5)
+        ttk.Button(project_frame, text="📂 Open Project", command=self.open_project).pack(side='right', padx=5)
+
         # JSON input
         input_frame = ttk.LabelFrame(main_frame, text="Scene JSON (Array of scenes)", padding=10)
         input_frame.pack(fill='both', expand=True, pady=10)
@@ -150,7 +540,10 @@ class VideoCreatorApp:
     "media_type": "photo"
   }
 ]"""
-        self.scenes_text.insert('1.0', example_json)
+        if self.scenes:
+            self.scenes_text.insert('1.0', json.dumps(self.scenes, indent=2))
+        else:
+            self.scenes_text.insert('1.0', example_json)
 
         # Buttons
         btn_frame = ttk.Frame(main_frame)
@@ -161,6 +554,42 @@ class VideoCreatorApp:
         ttk.Button(btn_frame, text="✅ Parse & Load Scenes", command=self.parse_scenes).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="🔍 Fetch All Media", command=self.fetch_all_media).pack(side='left', padx=5)
 
+    def open_project(self):
+        if self.workers:
+            messagebox.showwarning("Warning", "Please wait for background tasks to finish first!")
+            return
+
+        directory = filedialog.askdirectory(title="Open or Create Project Folder")
+        if not directory:
+            return
+
+        try:
+            self.attach_project(Project(directory))
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open project: {str(e)}")
+            return
+
+        self.config['project_dir'] = directory
+        self.save_config()
+
+        self.project_label.config(text=os.path.abspath(directory))
+        self.scenes_text.delete('1.0', tk.END)
+        self.scenes_text.insert('1.0', json.dumps(self.scenes, indent=2))
+        self.refresh_preview()
+
+        if self.audio_file:
+            self._audio_complete()
+        else:
+            self.audio_status.config(text="No audio generated yet", foreground='')
+            self.test_audio_btn.config(state='disabled')
+
+    def save_project(self):
+        try:
+            self.project.save()
+            messagebox.showinfo("Success", "Project saved successfully!")
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save project: {str(e)}")
+
     def load_scenes_file(self):
         filename = filedialog.askopenfilename(
             title="Load Scenes JSON",
@@ -186,10 +615,31 @@ class VideoCreatorApp:
     def parse_scenes(self):
         try:
             json_text = self.scenes_text.get('1.0', tk.END)
-            self.scenes = json.loads(json_text)
-            messagebox.showinfo("Success", f"Loaded {len(self.scenes)} scenes!")
+            data = json.loads(json_text)
         except json.JSONDecodeError as e:
             messagebox.showerror("Error", f"Invalid JSON: {str(e)}")
+            return
+
+        errors = validate_scenes(data)
+        if errors:
+            shown = "\n".join(errors[:20])
+            if len(errors) > 20:
+                shown += f"\n... and {len(errors) - 20} more"
+            messagebox.showerror("Error", f"Invalid scenes:\n{shown}")
+            return
+
+        # Artifacts are keyed by their inputs, so moved or unchanged scenes
+        # keep theirs; only the combined track depends on scene order
+        old_narration = [scene_inputs_hash(scene, 'tts') for scene in self.scenes]
+
+        self.project.set_scenes(data)
+        self.scenes = self.project.scenes
+        self.prune_artifacts()
+
+        if [scene_inputs_hash(scene, 'tts') for scene in self.scenes] != old_narration:
+            self.clear_audio()
+
+        messagebox.showinfo("Success", f"Loaded {len(self.scenes)} scenes!")
 
     def fetch_all_media(self):
         if not self.scenes:
@@ -197,11 +647,15 @@ class VideoCreatorApp:
             return
 
         # Start fetching in background
-        threading.Thread(target=self._fetch_all_media_worker, daemon=True).start()
+        self.start_worker(self._fetch_all_media_worker)
         messagebox.showinfo("Info", "Fetching media in background... Check Preview tab soon.")
 
     def _fetch_all_media_worker(self):
         for i, scene in enumerate(self.scenes):
+            # Skip media already fetched for this exact query, e.g. when resuming
+            if self._media_is_current(scene):
+                continue
+
             try:
                 if scene['media_source'] == 'pexels':
                     self.fetch_pexels_media(i, scene)
@@ -213,6 +667,19 @@ class VideoCreatorApp:
         # Update preview tab
         self.root.after(0, self.refresh_preview)
 
+    def scene_media(self, scene):
+        return self.media_cache.get(scene_inputs_hash(scene, 'media'))
+
+    def _media_is_current(self, scene):
+        cache = self.scene_media(scene)
+        return cache is not None and cache['status'] == 'success' and self.project.has_file(cache)
+
+    def prune_artifacts(self, affected=None):
+        sections = artifact_sections(affected) if affected is not None else SECTION_ARTIFACTS
+        for section in sections:
+            artifact = SECTION_ARTIFACTS[section]
+            self.project.prune(section, {scene_inputs_hash(scene, artifact) for scene in self.scenes})
+
     def fetch_pexels_media(self, index, scene):
         api_key = self.config.get('pexels_api_key', '')
         if not api_key:
@@ -234,47 +701,50 @@ class VideoCreatorApp:
             if scene['media_type'] == 'video':
                 if data['videos']:
                     video_url = data['videos'][0]['video_files'][0]['link']
-                    self.download_media(index, video_url, 'video')
+                    self.download_media(index, scene, video_url, 'video')
             else:
                 if data['photos']:
                     photo_url = data['photos'][0]['src']['large']
-                    self.download_media(index, photo_url, 'photo')
+                    self.download_media(index, scene, photo_url, 'photo')
 
     def fetch_ai_media(self, index, scene):
         if scene['media_type'] == 'photo':
             # Pollinations.ai image
             prompt = scene['query'].replace(' ', '%20')
             url = f"https://image.pollinations.ai/prompt/{prompt}"
-            self.download_media(index, url, 'photo')
+            self.download_media(index, scene, url, 'photo')
         else:
             # For video, we'll use image as fallback
             prompt = scene['query'].replace(' ', '%20')
             url = f"https://image.pollinations.ai/prompt/{prompt}"
-            self.download_media(index, url, 'photo')
+            self.download_media(index, scene, url, 'photo')
 
-    def download_media(self, index, url, media_type):
+    def download_media(self, index, scene, url, media_type):
+        inputs = scene_inputs_hash(scene, 'media')
         try:
             response = requests.get(url, timeout=30)
             if response.status_code == 200:
                 ext = '.mp4' if media_type == 'video' else '.jpg'
-                filepath = os.path.join(TEMP_DIR, f"scene_{index}{ext}")
+                filepath = os.path.join('media', f"{inputs}{ext}")
 
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+                atomic_write(self.project.path(filepath), response.content)
 
-                self.media_cache[index] = {
+                self.project.update('media', inputs, {
                     'filepath': filepath,
                     'media_type': media_type,
-                    'status': 'success'
-                }
+                    'status': 'success',
+                    'inputs': inputs,
+                    'sha1': hashlib.sha1(response.content).hexdigest()
+                })
         except Exception as e:
             print(f"Download error for scene {index}: {e}")
-            self.media_cache[index] = {
+            self.project.update('media', inputs, {
                 'filepath': None,
                 'media_type': media_type,
                 'status': 'failed',
+                'inputs': inputs,
                 'error': str(e)
-            }
+            })
 
     def create_preview_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -337,8 +807,8 @@ class VideoCreatorApp:
         ttk.Label(scene_frame, text=info_text, wraplength=800).pack(anchor='w', pady=5)
 
         # Media status
-        if index in self.media_cache:
-            cache = self.media_cache[index]
+        cache = self.scene_media(scene)
+        if cache is not None:
             if cache['status'] == 'success':
                 ttk.Label(scene_frame, text="✅ Media loaded",
                          foreground='green').pack(anchor='w')
@@ -346,7 +816,7 @@ class VideoCreatorApp:
                 # Show thumbnail for images
                 if cache['media_type'] == 'photo':
                     try:
-                        img = Image.open(cache['filepath'])
+                        img = Image.open(self.project.path(cache['filepath']))
                         img.thumbnail((200, 200))
                         photo = ImageTk.PhotoImage(img)
                         label = ttk.Label(scene_frame, image=photo)
@@ -372,7 +842,7 @@ class VideoCreatorApp:
 
     def retry_scene(self, index):
         scene = self.scenes[index]
-        threading.Thread(target=self._retry_scene_worker, args=(index, scene), daemon=True).start()
+        self.start_worker(self._retry_scene_worker, index, scene)
         messagebox.showinfo("Info", f"Retrying scene {index + 1}...")
 
     def _retry_scene_worker(self, index, scene):
@@ -392,7 +862,12 @@ class VideoCreatorApp:
         # Create edit dialog
         dialog = tk.Toplevel(self.root)
         dialog.title(f"Edit Scene {index + 1}")
-        dialog.geometry("500x300")
+        dialog.geometry("500x420")
+
+        ttk.Label(dialog, text="Narration:").pack(pady=5)
+        narration_text = tk.Text(dialog, width=50, height=4, wrap='word')
+        narration_text.insert('1.0', scene['narration'])
+        narration_text.pack(pady=5)
 
         ttk.Label(dialog, text="Query:").pack(pady=5)
         query_entry = ttk.Entry(dialog, width=50)
@@ -418,13 +893,50 @@ class VideoCreatorApp:
                        value="video").pack(side='left', padx=5)
 
         def save_edit():
-            scene['query'] = query_entry.get()
-            scene['media_source'] = source_var.get()
-            scene['media_type'] = type_var.get()
+            edited = dict(scene)
+            edited['narration'] = narration_text.get('1.0', tk.END).strip()
+            edited['query'] = query_entry.get()
+            edited['media_source'] = source_var.get()
+            edited['media_type'] = type_var.get()
+
+            errors = validate_scenes([edited])
+            if errors:
+                messagebox.showerror("Error", "\n".join(errors), parent=dialog)
+                return
+
+            changed = [field for field in SCENE_FIELDS if edited[field] != scene[field]]
             dialog.destroy()
+            if changed:
+                self.apply_scene_edit(index, edited, changed)
+
+        ttk.Button(dialog, text="💾 Save", command=save_edit).pack(pady=20)
+
+    def apply_scene_edit(self, index, scene, changed):
+        # Drop only the artifacts built from the changed fields and rebuild those
+        affected = affected_artifacts(changed)
+        had_audio = self.project.audio is not None
+
+        self.project.set_scene(index, scene)
+        self.scenes = self.project.scenes
+        self.prune_artifacts(affected)
+
+        if 'tts' in affected:
+            self.clear_audio()
+
+        if 'media' in affected:
             self.retry_scene(index)
+        if 'tts' in affected and had_audio:
+            self.generate_audio()
 
-        ttk.Button(dialog, text="💾 Save & Retry", command=save_edit).pack(pady=20)
+        self.refresh_preview()
+
+    def clear_audio(self):
+        # The combined track no longer matches the narration
+        if self.project.audio is not None:
+            self.project.set_audio(None)
+        self.audio_file = None
+        self.audio_status.config(text="No audio generated yet", foreground='')
+        self.test_audio_btn.config(state='disabled')
 
     def create_audio_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -482,72 +994,115 @@ class VideoCreatorApp:
             messagebox.showwarning("Warning", "Please load scenes first!")
             return
 
-        # Combine all narrations
-        full_text = " ".join([scene['narration'] for scene in self.scenes])
+        engine_name = self.tts_engine.get()
+        try:
+            engine = self.get_tts_engine(engine_name)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not start TTS engine: {str(e)}")
+            return
 
-        threading.Thread(target=self._generate_audio_worker,
-                        args=(full_text,), daemon=True).start()
+        self.start_worker(self._generate_audio_worker, engine_name, engine, self.voice_var.get())
 
         self.audio_status.config(text="⏳ Generating audio...")
 
-    def _generate_audio_worker(self, text):
+    def _generate_audio_worker(self, engine_name, engine, voice):
+        pending = {}
+        jobs = {}
+        error = None
         try:
-            engine = self.tts_engine.get()
+            # One segment per distinct narration, so finished segments survive
+            # a crash and their offsets in the combined track are known
+            keys = []
+            for scene in self.scenes:
+                key = scene_inputs_hash(scene, 'tts', engine_name, voice if engine.uses_voice else None)
+                keys.append(key)
+                if self.project.has_file(self.project.narration.get(key)) or key in jobs:
+                    continue
+
+                filepath = os.path.join('audio', f"{key}{engine.extension}")
+                future = engine.submit(scene['narration'], voice, self.project.path(filepath))
+                pending[future] = key
+                jobs[key] = (filepath, scene_inputs_hash(scene, 'tts'), len(scene['narration']))
+
+            started = time.perf_counter()
+            done = 0
+            characters = 0
+
+            # Record each segment as soon as it lands. After a failure, keep
+            # recording whatever still finishes so that work isn't lost.
+            for future in as_completed(pending):
+                if future.cancelled():
+                    continue
+                try:
+                    future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+                        for other in pending:
+                            other.cancel()
+                    continue
+
+                key = pending[future]
+                filepath, inputs, length = jobs[key]
+                self.project.update('narration', key, {
+                    'filepath': filepath,
+                    'inputs': inputs
+                })
+                done += 1
+                characters += length
 
-            if engine == "edge":
-                self.generate_edge_tts(text)
-            elif engine == "kokoro":
-                self.generate_kokoro_tts(text)
-            elif engine == "pollinations":
-                self.generate_pollinations_audio(text)
+                self.root.after(0, lambda done=done: self.audio_status.config(
+                    text=f"⏳ Generated audio for {done}/{len(pending)} scenes..."))
 
-            self.root.after(0, self._audio_complete)
-        except Exception as e:
-            self.root.after(0, lambda: self.audio_status.config(
-                text=f"❌ Error: {str(e)}", foreground='red'))
-
-    def generate_edge_tts(self, text):
-        voice = self.voice_var.get()
-        output_file = os.path.join(TEMP_DIR, "audio.mp3")
+            if done:
+                engine.record(characters, done, time.perf_counter() - started)
+            if error is not None:
+                raise error
 
-        async def run_tts():
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(output_file)
+            self.combine_narration(keys)
 
-        asyncio.run(run_tts())
-        self.audio_file = output_file
+            self.root.after(0, lambda: self._audio_complete(engine))
+        except Exception as e:
+            for future in pending:
+                future.cancel()
+            error_msg = str(e)
+            self.root.after(0, lambda: self.audio_status.config(
+                text=f"❌ Error: {error_msg}", foreground='red'))
 
-    def generate_kokoro_tts(self, text):
-        # Kokoro TTS - using espeak as fallback since kokoro setup is complex
-        output_file = os.path.join(TEMP_DIR, "audio.wav")
+    def combine_narration(self, keys):
+        segments = [self.project.narration[key] for key in keys]
+        audio_hash = content_hash(keys)
 
-        # Using espeak as fallback
-        subprocess.run(['espeak', '-w', output_file, text],
-                      capture_output=True, timeout=60)
+        audio = self.project.audio
+        if audio and audio['hash'] == audio_hash and self.project.has_file(audio):
+            self.audio_file = self.project.path(audio['filepath'])
+            return
 
+        combined = AudioSegment.empty()
+        offsets = []
+        for segment in segments:
+            start = len(combined) / 1000.0
+            combined += AudioSegment.from_file(self.project.path(segment['filepath']))
+            offsets.append([start, len(combined) / 1000.0])
+
+        filepath = os.path.join('audio', "narration.mp3")
+        output_file = self.project.path(filepath)
+        partial_file = self.project.path(os.path.join('audio', "narration.part.mp3"))
+        combined.export(partial_file, format='mp3')
+        os.replace(partial_file, output_file)
+
+        self.project.set_audio({
+            'filepath': filepath,
+            'hash': audio_hash,
+            'offsets': offsets
+        })
         self.audio_file = output_file
 
-    def generate_pollinations_audio(self, text):
-        output_file = os.path.join(TEMP_DIR, "audio.mp3")
-
-        # Pollinations.ai audio endpoint
-        url = "https://text-to-speech.pollinations.ai/audio"
-        params = {
-            "text": text,
-            "voice": "en-US-AriaNeural"
-        }
-
-        response = requests.get(url, params=params, timeout=60)
-
-        if response.status_code == 200:
-            with open(output_file, 'wb') as f:
-                f.write(response.content)
-            self.audio_file = output_file
-        else:
-            raise Exception(f"Audio generation failed: {response.status_code}")
-
-    def _audio_complete(self):
-        self.audio_status.config(text="✅ Audio generated successfully!", foreground='green')
+    def _audio_complete(self, engine=None):
+        text = "✅ Audio generated successfully!"
+        if engine and engine.requests:
+            text += f" ({engine.label}: {engine.throughput:.0f} chars/sec)"
+        self.audio_status.config(text=text, foreground='green')
         self.test_audio_btn.config(state='normal')
 
     def test_audio(self):
@@ -586,6 +1141,16 @@ class VideoCreatorApp:
         ttk.Checkbutton(subtitle_frame, text="Generate subtitles using WhisperX",
                        variable=self.generate_subtitles).pack(anchor='w')
 
+        # Output formats
+        output_frame = ttk.LabelFrame(main_frame, text="Output Formats", padding=10)
+        output_frame.pack(fill='x', pady=10)
+
+        self.output_targets = {}
+        for name, target in OUTPUT_TARGETS.items():
+            self.output_targets[name] = tk.BooleanVar(value=(name == '1080p'))
+            ttk.Checkbutton(output_frame, text=target['label'],
+                           variable=self.output_targets[name]).pack(side='left', padx=5)
+
         # Export button
         ttk.Button(main_frame, text="🎬 Create Video",
                   command=self.create_video).pack(pady=20)
@@ -608,8 +1173,8 @@ class VideoCreatorApp:
 
         # Check if all media is loaded
         missing = []
-        for i in range(len(self.scenes)):
-            if i not in self.media_cache or self.media_cache[i]['status'] != 'success':
+        for i, scene in enumerate(self.scenes):
+            if not self._media_is_current(scene):
                 missing.append(i + 1)
 
         if missing:
@@ -617,103 +1182,215 @@ class VideoCreatorApp:
                 f"Missing media for scenes: {', '.join(map(str, missing))}")
             return
 
-        threading.Thread(target=self._create_video_worker, daemon=True).start()
+        targets = [name for name, var in self.output_targets.items() if var.get()]
+        if not targets:
+            messagebox.showwarning("Warning", "Please select at least one output format!")
+            return
+
+        self.start_worker(self._create_video_worker, targets)
 
         self.export_progress.start()
         self.export_status.config(text="⏳ Creating video...")
 
-    def _create_video_worker(self):
+    def _create_video_worker(self, targets):
         try:
             # Get audio duration
             audio = AudioFileClip(self.audio_file)
             total_duration = audio.duration
+            audio.close()
 
             # Calculate duration per scene
             scene_duration = float(self.scene_duration.get())
 
-            # Create video clips
-            clips = []
+            # Render one segment per scene, reusing segments from earlier runs
+            segment_files = []
             current_time = 0
 
             for i, scene in enumerate(self.scenes):
-                cache = self.media_cache[i]
-                filepath = cache['filepath']
-
                 # Determine clip duration
                 clip_duration = min(scene_duration, total_duration - current_time)
 
-                if cache['media_type'] == 'video':
-                    clip = VideoFileClip(filepath)
-                    if clip.duration < clip_duration:
-                        # Loop video
-                        clip = clip.loop(duration=clip_duration)
-                    else:
-                        # Trim video
-                        clip = clip.subclip(0, clip_duration)
-                else:
-                    # Image clip
-                    clip = ImageClip(filepath, duration=clip_duration)
+                self.root.after(0, lambda i=i: self.export_status.config(
+                    text=f"⏳ Rendering scene {i + 1}/{len(self.scenes)}..."))
 
-                clips.append(clip)
+                segment_files.append(self.render_segment(scene, clip_duration))
                 current_time += clip_duration
 
                 if current_time >= total_duration:
                     break
 
-            # Concatenate clips
-            final_video = concatenate_videoclips(clips, method="compose")
-
-            # Add audio
-            final_video = final_video.set_audio(audio)
-
             # Generate subtitles if requested
+            srt_file = None
             if self.generate_subtitles.get():
                 self.root.after(0, lambda: self.export_status.config(
                     text="⏳ Generating subtitles..."))
 
                 srt_file = self.generate_subtitles_file()
 
-                if srt_file:
-                    # Use ffmpeg to burn subtitles
-                    temp_output = os.path.join(TEMP_DIR, "video_no_subs.mp4")
-                    final_video.write_videofile(temp_output, codec='libx264', audio_codec='aac')
+            self.root.after(0, lambda: self.export_status.config(
+                text="⏳ Joining segments..."))
 
-                    output_file = os.path.join(OUTPUT_DIR, f"video_{int(time.time())}.mp4")
+            timestamp = int(time.time())
+            outputs = [(OUTPUT_TARGETS[name], os.path.join(OUTPUT_DIR, f"video_{timestamp}_{name}.mp4"))
+                       for name in targets]
+            self.join_segments(segment_files, srt_file, outputs)
 
-                    cmd = [
-                        'ffmpeg', '-i', temp_output,
-                        '-vf', f"subtitles={srt_file}",
-                        '-c:a', 'copy',
-                        output_file
-                    ]
+            output_files = [output_file for _, output_file in outputs]
+            self.root.after(0, lambda: self._video_complete(output_files))
 
-                    subprocess.run(cmd, capture_output=True, timeout=300)
-                else:
-                    output_file = os.path.join(OUTPUT_DIR, f"video_{int(time.time())}.mp4")
-                    final_video.write_videofile(output_file, codec='libx264', audio_codec='aac')
+        except Exception as e:
+            error_msg = str(e)
+            self.root.after(0, lambda: self._video_error(error_msg))
+
+    def render_segment(self, scene, duration):
+        cache = self.scene_media(scene)
+        segment_hash = content_hash(cache.get('sha1', cache['filepath']), cache['media_type'],
+                                    round(duration, 3), RENDER_SIZE, RENDER_FPS)
+
+        segment = self.project.segments.get(segment_hash)
+        if self.project.has_file(segment):
+            return self.project.path(segment['filepath'])
+
+        filepath = self.project.path(cache['filepath'])
+
+        if cache['media_type'] == 'video':
+            clip = VideoFileClip(filepath, audio=False)
+            if clip.duration < duration:
+                # Loop video
+                clip = clip.loop(duration=duration)
             else:
-                output_file = os.path.join(OUTPUT_DIR, f"video_{int(time.time())}.mp4")
-                final_video.write_videofile(output_file, codec='libx264', audio_codec='aac')
+                # Trim video
+                clip = clip.subclip(0, duration)
+        else:
+            # Image clip
+            clip = ImageClip(filepath, duration=duration)
+
+        # Letterbox into a common frame so segments can be joined without re-encoding
+        width, height = RENDER_SIZE
+        scale = min(width / clip.w, height / clip.h)
+        frame = clip.resize(scale).on_color(size=RENDER_SIZE, color=(0, 0, 0), pos='center')
+
+        segment_path = os.path.join('segments', f"{segment_hash}.mp4")
+        partial_file = self.project.path(os.path.join('segments', f"{segment_hash}.part.mp4"))
+        frame.write_videofile(partial_file, fps=RENDER_FPS, codec='libx264', audio=False, logger=None)
+        clip.close()
+        os.replace(partial_file, self.project.path(segment_path))
+
+        self.project.update('segments', segment_hash, {
+            'filepath': segment_path,
+            'inputs': scene_inputs_hash(scene, 'segment')
+        })
+        return self.project.path(segment_path)
+
+    def join_segments(self, segment_files, srt_file, outputs):
+        list_file = self.project.path(os.path.join('segments', "concat.txt"))
+        with open(list_file, 'w') as f:
+            for segment_file in segment_files:
+                # Quote per the concat demuxer: ' becomes '\''
+                quoted = os.path.abspath(segment_file).replace("'", "'\\''")
+                f.write(f"file '{quoted}'\n")
+
+        # ffmpeg runs from the subtitle file's folder so the filtergraph only
+        # sees its bare file name; escaping a full path (drive letters,
+        # commas, brackets, quotes) for filter options is fragile
+        workdir = os.path.dirname(os.path.abspath(srt_file)) if srt_file else None
+        subtitles = os.path.basename(srt_file) if srt_file else None
+
+        # All outputs come from a single ffmpeg run: the segments are decoded
+        # once and the frames split between the encoders
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', os.path.abspath(list_file),
+            '-i', os.path.abspath(self.narration_aac())
+        ]
+
+        filtered = [i for i, (target, _) in enumerate(outputs)
+                    if not self._can_copy_video(target, srt_file)]
+        labels = {}
+        if filtered:
+            if len(filtered) > 1:
+                chains = [f"[0:v]split={len(filtered)}" +
+                          "".join(f"[split{k}]" for k in range(len(filtered)))]
+                sources = [f"split{k}" for k in range(len(filtered))]
+            else:
+                chains = []
+                sources = ['0:v']
+
+            # Subtitles are burned after each target's scale/crop, so cropped
+            # formats don't cut lines off at the edges
+            for k, i in enumerate(filtered):
+                chains.append(f"[{sources[k]}]{self._fit_filter(outputs[i][0], subtitles)}[out{k}]")
+                labels[i] = f"[out{k}]"
+
+            cmd += ['-filter_complex', ";".join(chains)]
+
+        for i, (target, output_file) in enumerate(outputs):
+            if i in labels:
+                cmd += ['-map', labels[i], '-c:v', 'libx264']
+                if target['bitrate']:
+                    cmd += ['-b:v', target['bitrate']]
+            else:
+                cmd += ['-map', '0:v', '-c:v', 'copy']
 
-            self.root.after(0, lambda: self._video_complete(output_file))
+            cmd += ['-map', '1:a', '-c:a', 'copy', '-shortest', os.path.abspath(output_file)]
 
-        except Exception as e:
-            self.root.after(0, lambda: self._video_error(str(e)))
+        result = subprocess.run(cmd, capture_output=True, cwd=workdir)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg failed: {result.stderr.decode(errors='ignore')[-500:]}")
+
+    def narration_aac(self):
+        # Encode the narration to AAC once per track; every output copies it
+        audio = self.project.audio
+        aac = audio.get('aac_filepath')
+        if aac and os.path.exists(self.project.path(aac)):
+            return self.project.path(aac)
+
+        aac = os.path.join('audio', "narration.m4a")
+        partial_file = self.project.path(os.path.join('audio', "narration.part.m4a"))
+        cmd = ['ffmpeg', '-y', '-i', self.audio_file, '-vn', '-c:a', 'aac', partial_file]
+
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg failed: {result.stderr.decode(errors='ignore')[-500:]}")
+        os.replace(partial_file, self.project.path(aac))
+
+        self.project.set_audio(dict(audio, aac_filepath=aac))
+        return self.project.path(aac)
+
+    def _can_copy_video(self, target, srt_file):
+        return not srt_file and target['bitrate'] is None and tuple(target['size']) == RENDER_SIZE
+
+    def _fit_filter(self, target, subtitles=None):
+        width, height = target['size']
+        if target['fit'] == 'crop':
+            fit = (f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+                   f"crop={width}:{height}")
+        else:
+            fit = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                   f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
+        if subtitles:
+            fit += f",subtitles={subtitles}"
+        return fit + ",setsar=1,format=yuv420p"
 
     def generate_subtitles_file(self):
         try:
             # Using whisperx for subtitle generation
             # This is a simplified version - full whisperx integration would be more complex
 
-            # For now, create a simple SRT with narrations
-            srt_file = os.path.join(TEMP_DIR, "subtitles.srt")
+            # For now, create a simple SRT with narrations, timed from the
+            # narration segment offsets when the audio has them
+            srt_file = self.project.path("subtitles.srt")
 
             scene_duration = float(self.scene_duration.get())
+            offsets = (self.project.audio or {}).get('offsets') or []
 
             with open(srt_file, 'w') as f:
                 for i, scene in enumerate(self.scenes):
-                    start_time = i * scene_duration
-                    end_time = start_time + scene_duration
+                    if i < len(offsets):
+                        start_time, end_time = offsets[i]
+                    else:
+                        start_time = i * scene_duration
+                        end_time = start_time + scene_duration
 
                     f.write(f"{i + 1}\n")
                     f.write(f"{self._format_srt_time(start_time)} --> {self._format_srt_time(end_time)}\n")
@@ -732,10 +1409,10 @@ class VideoCreatorApp:
         millis = int((seconds % 1) * 1000)
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
-    def _video_complete(self, output_file):
+    def _video_complete(self, output_files):
         self.export_progress.stop()
-        self.export_status.config(text=f"✅ Video created: {output_file}", foreground='green')
-        messagebox.showinfo("Success", f"Video created successfully!\n{output_file}")
+        self.export_status.config(text=f"✅ Video created: {', '.join(output_files)}", foreground='green')
+        messagebox.showinfo("Success", "Video created successfully!\n" + "\n".join(output_files))
 
     def _video_error(self, error_msg):
         self.export_progress.stop()
@@ -0,0 +1,207 @@
+import json
+import os
+import tempfile
+import threading
+import hashlib
+
+PROJECT_MANIFEST = "manifest.json"
+PROJECT_JOURNAL = "journal.jsonl"
+PROJECT_VERSION = 1
+JOURNAL_COMPACT_THRESHOLD = 500
+
+
+def atomic_write(path, data):
+    # Write to a sibling temp file and rename it over the target, so a crash
+    # leaves either the old file or the new one - never a truncated mix
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, compact=False):
+    if compact:
+        text = json.dumps(data, separators=(',', ':'))
+    else:
+        text = json.dumps(data, indent=2)
+    atomic_write(path, text.encode('utf-8'))
+
+
+def content_hash(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# On-disk project: a compact manifest plus an append-only journal.
+# Every change is appended to the journal as one small JSON line, so saves are
+# incremental and cost the same with ten scenes or ten thousand. The journal is
+# periodically folded into the manifest with an atomic rename; opening reads
+# the manifest and replays whatever the journal holds. Each fold bumps a
+# generation number stored in the manifest and stamped on every journal line,
+# so entries already folded in are never replayed a second time.
+class Project:
+
+    SECTIONS = ('media', 'narration', 'segments')
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.lock = threading.RLock()
+
+        # Scene list plus the artifacts derived from it. Artifacts are keyed by
+        # the hash of their inputs, so reordering scenes keeps them valid.
+        self.scenes = []
+        self.media = {}
+        self.narration = {}
+        self.segments = {}
+        self.audio = None
+        self.generation = 0
+
+        for subdir in ('media', 'audio', 'segments'):
+            os.makedirs(os.path.join(root_dir, subdir), exist_ok=True)
+
+        replayed = self._load()
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        self._journal_entries = 0
+        self.closed = False
+
+        # Fold a non-empty journal in right away so that a line torn by a
+        # crash is never followed by new entries
+        if replayed:
+            self.save()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.root_dir, PROJECT_MANIFEST)
+
+    @property
+    def _journal_path(self):
+        return os.path.join(self.root_dir, PROJECT_JOURNAL)
+
+    def _load(self):
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.scenes = manifest.get('scenes', [])
+            for section in self.SECTIONS:
+                table = getattr(self, section)
+                for key, value in manifest.get(section, {}).items():
+                    table[key] = value
+            self.audio = manifest.get('audio')
+            self.generation = manifest.get('generation', 0)
+
+        replayed = 0
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write from a crash - everything before it is intact
+                        continue
+
+                    # Left over from a crash after the manifest was written
+                    # but before the journal was cleared
+                    if entry.get('g', 0) < self.generation:
+                        continue
+
+                    self._apply(entry['s'], entry.get('k'), entry.get('v'))
+                    replayed += 1
+        return replayed
+
+    def _apply(self, section, key, value):
+        if section == 'scenes':
+            self.scenes = value
+        elif section == 'scene':
+            if 0 <= key < len(self.scenes):
+                self.scenes[key] = value
+        elif section == 'audio':
+            self.audio = value
+        else:
+            table = getattr(self, section)
+            if value is None:
+                table.pop(key, None)
+            else:
+                table[key] = value
+
+    def _record(self, section, key, value):
+        with self.lock:
+            # A worker can still finish after the window closed; drop its result
+            if self.closed:
+                return
+
+            self._apply(section, key, value)
+            line = json.dumps({'g': self.generation, 's': section, 'k': key, 'v': value},
+                              separators=(',', ':'))
+            self._journal.write(line + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal_entries += 1
+
+            if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+                self.save()
+
+    def set_scenes(self, scenes):
+        self._record('scenes', None, scenes)
+
+    def set_scene(self, index, scene):
+        self._record('scene', index, scene)
+
+    def set_audio(self, audio):
+        self._record('audio', None, audio)
+
+    def update(self, section, key, value):
+        self._record(section, key, value)
+
+    def save(self):
+        with self.lock:
+            manifest = {
+                'version': PROJECT_VERSION,
+                'generation': self.generation + 1,
+                'scenes': self.scenes,
+                'audio': self.audio,
+            }
+            for section in self.SECTIONS:
+                manifest[section] = getattr(self, section)
+
+            # If we crash between writing the manifest and clearing the
+            # journal, the journal's older generation makes _load skip it
+            atomic_write_json(self._manifest_path, manifest, compact=True)
+            self.generation += 1
+            self._journal.truncate(0)
+            self._journal_entries = 0
+
+    def prune(self, section, live_inputs):
+        # Forget artifacts no scene is built from anymore, files included
+        with self.lock:
+            table = getattr(self, section)
+            for key, entry in list(table.items()):
+                if entry.get('inputs') in live_inputs:
+                    continue
+                if self.has_file(entry):
+                    os.remove(self.path(entry['filepath']))
+                self.update(section, key, None)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.save()
+            self._journal.close()
+            self.closed = True
+
+    def path(self, relpath):
+        return os.path.join(self.root_dir, relpath)
+
+    def has_file(self, entry):
+        return bool(entry) and bool(entry.get('filepath')) and os.path.exists(self.path(entry['filepath']))
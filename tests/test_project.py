@@ -0,0 +1,66 @@
+import json
+import os
+
+from project import PROJECT_JOURNAL, PROJECT_MANIFEST, Project
+
+
+def scene(name):
+    return {"narration": name, "media_source": "ai", "query": name, "media_type": "photo"}
+
+
+def test_reopen_replays_journal(tmp_path):
+    project = Project(str(tmp_path))
+    project.set_scenes([scene("a"), scene("b")])
+    project.update('media', 'b', {'filepath': 'media/b.jpg', 'status': 'success'})
+    project._journal.close()
+
+    reopened = Project(str(tmp_path))
+    assert [s['narration'] for s in reopened.scenes] == ["a", "b"]
+    assert reopened.media == {'b': {'filepath': 'media/b.jpg', 'status': 'success'}}
+
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    project = Project(str(tmp_path))
+    project.set_scenes([scene("a")])
+    project._journal.write('{"g":0,"s":"scene","k":0,"v":{"narr')
+    project._journal.close()
+
+    reopened = Project(str(tmp_path))
+    assert reopened.scenes == [scene("a")]
+
+    # The torn line was folded away, so new entries land on a clean journal
+    reopened.set_scene(0, scene("b"))
+    reopened._journal.close()
+    assert Project(str(tmp_path)).scenes == [scene("b")]
+
+
+def test_stale_journal_is_not_replayed(tmp_path):
+    project = Project(str(tmp_path))
+    project.set_scenes([scene(str(i)) for i in range(6)])
+    project.save()
+    project.set_scene(5, scene("edited"))
+    project.set_scenes([scene("x"), scene("y")])
+
+    # Crash after the manifest is written but before the journal is cleared
+    journal = open(os.path.join(str(tmp_path), PROJECT_JOURNAL)).read()
+    project.save()
+    project._journal.close()
+    with open(os.path.join(str(tmp_path), PROJECT_JOURNAL), 'w') as f:
+        f.write(journal)
+
+    reopened = Project(str(tmp_path))
+    assert reopened.scenes == [scene("x"), scene("y")]
+    with open(os.path.join(str(tmp_path), PROJECT_MANIFEST)) as f:
+        assert json.load(f)['generation'] == reopened.generation
+
+
+def test_prune_drops_unreferenced_artifacts(tmp_path):
+    project = Project(str(tmp_path))
+    for name in ("keep", "drop"):
+        with open(project.path(f"media/{name}.jpg"), 'wb') as f:
+            f.write(b"x")
+        project.update('media', name, {'filepath': f"media/{name}.jpg", 'inputs': name})
+
+    project.prune('media', {"keep"})
+    assert list(project.media) == ["keep"]
+    assert not os.path.exists(project.path("media/drop.jpg"))
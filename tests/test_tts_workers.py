@@ -0,0 +1,44 @@
+import io
+import json
+
+import tts_workers
+
+
+class FakeBackend:
+    def load(self):
+        pass
+
+    def synthesize(self, text, voice, output_file, timeout):
+        if text == "fail":
+            raise Exception("boom")
+        with open(output_file, 'w') as f:
+            f.write(text)
+
+
+def test_serve_answers_each_request(tmp_path, monkeypatch):
+    monkeypatch.setitem(tts_workers.LOCAL_TTS_BACKENDS, 'fake', FakeBackend)
+    requests = [
+        json.dumps({'text': "hello", 'voice': None, 'output_file': str(tmp_path / "a.wav"), 'timeout': 5}),
+        json.dumps({'text': "fail", 'voice': None, 'output_file': str(tmp_path / "b.wav"), 'timeout': 5}),
+    ]
+    out = io.StringIO()
+
+    tts_workers.serve('fake', requests, out)
+
+    replies = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert replies == [{'ready': True}, {'ok': True}, {'error': "boom"}]
+    assert (tmp_path / "a.wav").read_text() == "hello"
+    assert not (tmp_path / "b.wav").exists()
+
+
+def test_serve_reports_load_failure(monkeypatch):
+    class Missing(FakeBackend):
+        def load(self):
+            raise Exception("not installed")
+
+    monkeypatch.setitem(tts_workers.LOCAL_TTS_BACKENDS, 'missing', Missing)
+    out = io.StringIO()
+
+    tts_workers.serve('missing', [], out)
+
+    assert json.loads(out.getvalue()) == {'error': "not installed"}
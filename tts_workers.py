@@ -0,0 +1,115 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import sys
+import time
+import wave
+
+# Long-lived local TTS worker. LocalTTSEngine in app.py starts a few of these
+# as separate processes; each loads its backend once and then serves requests,
+# one JSON line in and one JSON line out. Kept free of GUI and video imports so
+# workers start quickly.
+
+
+# Backends: load() runs once per worker, synthesize() once per request.
+class EspeakBackend:
+    # Constants from espeak-ng's speak_lib.h
+    AUDIO_OUTPUT_SYNCHRONOUS = 2
+    POS_CHARACTER = 1
+    CHARS_UTF8 = 1
+
+    SynthCallback = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short),
+                                     ctypes.c_int, ctypes.c_void_p)
+
+    def load(self):
+        # Use libespeak-ng in-process rather than starting espeak per request
+        library = ctypes.util.find_library('espeak-ng') or ctypes.util.find_library('espeak')
+        if not library:
+            raise Exception("espeak-ng is not installed")
+
+        self.lib = ctypes.CDLL(library)
+        self.lib.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        self.lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        self.lib.espeak_Synth.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+                                          ctypes.c_uint, ctypes.c_uint, ctypes.POINTER(ctypes.c_uint),
+                                          ctypes.c_void_p]
+
+        self.sample_rate = self.lib.espeak_Initialize(self.AUDIO_OUTPUT_SYNCHRONOUS, 0, None, 0)
+        if self.sample_rate <= 0:
+            raise Exception("espeak-ng failed to initialize")
+
+        # Select a voice explicitly rather than relying on the library default
+        if self.lib.espeak_SetVoiceByName(b"en") != 0:
+            raise Exception("espeak-ng has no 'en' voice installed")
+
+        # Keep a reference so the callback isn't garbage collected
+        self._callback = self.SynthCallback(self._on_samples)
+        self.lib.espeak_SetSynthCallback(self._callback)
+
+    def _on_samples(self, wav, numsamples, events):
+        if wav and numsamples > 0:
+            self._samples.extend(ctypes.string_at(wav, numsamples * 2))
+
+        # Returning 1 tells espeak to stop synthesizing
+        if time.perf_counter() > self._deadline:
+            self._timed_out = True
+            return 1
+        return 0
+
+    def synthesize(self, text, voice, output_file, timeout):
+        self._samples = bytearray()
+        self._deadline = time.perf_counter() + timeout
+        self._timed_out = False
+
+        data = text.encode('utf-8')
+        result = self.lib.espeak_Synth(data, len(data) + 1, 0, self.POS_CHARACTER, 0,
+                                       self.CHARS_UTF8, None, None)
+        if result != 0:
+            raise Exception(f"espeak-ng synthesis failed (error {result})")
+        if self._timed_out:
+            raise Exception(f"Audio generation timed out after {timeout:.0f}s")
+
+        with wave.open(output_file, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(bytes(self._samples))
+
+
+LOCAL_TTS_BACKENDS = {
+    'espeak': EspeakBackend,
+}
+
+
+def reply(out, message):
+    out.write(json.dumps(message) + '\n')
+    out.flush()
+
+
+def serve(backend_name, requests, out):
+    try:
+        backend = LOCAL_TTS_BACKENDS[backend_name]()
+        backend.load()
+    except Exception as e:
+        reply(out, {'error': str(e)})
+        return
+    reply(out, {'ready': True})
+
+    for line in requests:
+        request = json.loads(line)
+        partial_file = request['output_file'] + '.part'
+        try:
+            backend.synthesize(request['text'], request['voice'], partial_file, request['timeout'])
+            os.replace(partial_file, request['output_file'])
+            reply(out, {'ok': True})
+        except Exception as e:
+            reply(out, {'error': str(e)})
+
+
+if __name__ == "__main__":
+    # Keep the protocol on its own descriptor so anything a backend library
+    # prints can't corrupt it
+    out = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    os.dup2(2, 1)
+    serve(sys.argv[1], sys.stdin, out)